@@ -5,6 +5,7 @@ Example usage of the Shard Manager for database sharding
 
 from shard_manager import (
     ShardConfig, 
+    ShardEndpoint,
     ShardManager, 
     ConsistentHashShardManager,
     create_user_shard_manager,
@@ -18,16 +19,17 @@ class DatabaseRouter:
     def __init__(self, shard_manager: ShardManager):
         self.shard_manager = shard_manager
         self.db_configs = shard_manager.get_database_config("myapp")
+        # Bound once so routing skips the self.shard_manager attribute chain
+        self._get_shard = shard_manager.cached_get_shard_id
         
-    def get_database_connection_info(self, user_id: str) -> dict:
+    def get_database_connection_info(self, user_id: str) -> ShardEndpoint:
         """Get database connection info for a specific user"""
-        shard_id = self.shard_manager.get_shard_id(user_id)
-        return self.db_configs[shard_id]
+        return self.db_configs[self._get_shard(user_id)]
     
     def route_query(self, user_id: str, query: str) -> str:
         """Route a query to the appropriate shard"""
-        db_info = self.get_database_connection_info(user_id)
-        return f"Execute '{query}' on {db_info['database_name']} at {db_info['host']}:{db_info['port']}"
+        db_info = self.db_configs[self._get_shard(user_id)]
+        return f"Execute '{query}' on {db_info.database_name} at {db_info.host}:{db_info.port}"
 
 
 def demonstrate_basic_sharding():
@@ -70,9 +72,9 @@ def demonstrate_database_routing():
     for user in users:
         db_info = router.get_database_connection_info(user)
         print(f"User {user}:")
-        print(f"  Database: {db_info['database_name']}")
-        print(f"  Host: {db_info['host']}")
-        print(f"  Port: {db_info['port']}")
+        print(f"  Database: {db_info.database_name}")
+        print(f"  Host: {db_info.host}")
+        print(f"  Port: {db_info.port}")
         
         # Example query routing
         query_result = router.route_query(user, "SELECT * FROM orders WHERE user_id = ?")
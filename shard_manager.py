@@ -3,9 +3,27 @@ try:
     HAS_MMH3 = True
 except ImportError:
     HAS_MMH3 = False
-    import hashlib
 
-from typing import Union, List, Optional
+try:
+    import xxhash
+    HAS_XXHASH = True
+except ImportError:
+    HAS_XXHASH = False
+
+try:
+    import numpy as np
+    HAS_NUMPY = True
+except ImportError:
+    HAS_NUMPY = False
+
+import array
+import bisect
+import functools
+import hashlib
+import os
+import tempfile
+from collections import Counter
+from typing import NamedTuple, Union, List, Optional
 from dataclasses import dataclass
 
 
@@ -14,7 +32,20 @@ class ShardConfig:
     """Configuration for database sharding"""
     total_shards: int
     hash_seed: int = 0
-    algorithm: str = "murmur3_32"  # or "murmur3_128" 
+    algorithm: str = "murmur3_32"  # or "murmur3_128", "xxh3_64"
+    cache_size: int = 100_000  # max entries memoized by cached_get_shard_id
+
+
+class ShardEndpoint(NamedTuple):
+    """Connection details for a single database shard"""
+    shard_id: int
+    database_name: str
+    host: str
+    port: int
+
+
+# Bump when the on-disk ring cache layout changes so old files are ignored
+RING_CACHE_VERSION = 1
 
 
 class MurmurHash:
@@ -36,13 +67,14 @@ class MurmurHash:
             # mmh3.hash returns signed int by default, convert to unsigned
             return mmh3.hash(key, seed, signed=False)
         else:
-            # Fallback implementation using Python's built-in hash
+            # Fallback implementation using keyed BLAKE2b, which (unlike the
+            # built-in hash) is stable across processes
             if isinstance(key, str):
                 key = key.encode('utf-8')
             
-            # Simple fallback - combine key and seed for hashing
-            combined = str(seed).encode() + key
-            return abs(hash(combined.hex())) & 0xffffffff
+            seed_bytes = (seed & 0xffffffff).to_bytes(4, 'little')
+            digest = hashlib.blake2b(key, digest_size=4, key=seed_bytes).digest()
+            return int.from_bytes(digest, 'little')
     
     @staticmethod
     def murmur3_128(key: Union[str, bytes], seed: int = 0) -> int:
@@ -54,19 +86,48 @@ class MurmurHash:
             seed: Hash seed for consistent hashing
             
         Returns:
-            64-bit hash value (lower part of 128-bit hash)
+            64-bit hash value (lower part of 128-bit hash, unsigned)
         """
         if HAS_MMH3:
             # mmh3.hash128 returns a 128-bit integer, take lower 64 bits
             hash_128 = mmh3.hash128(key, seed, signed=False)
-            return hash_128 & 0x7fffffffffffffff
+            return hash_128 & 0xffffffffffffffff
         else:
             # Fallback implementation
             if isinstance(key, str):
                 key = key.encode('utf-8')
             
-            combined = str(seed).encode() + key
-            return abs(hash(combined.hex())) & 0x7fffffffffffffff
+            seed_bytes = (seed & 0xffffffff).to_bytes(4, 'little')
+            digest = hashlib.blake2b(key, digest_size=8, key=seed_bytes).digest()
+            return int.from_bytes(digest, 'little')
+
+
+class XXHash:
+    """Wrapper for xxHash algorithms using xxhash library when available"""
+    
+    @staticmethod
+    def xxh3_64(key: Union[str, bytes], seed: int = 0) -> int:
+        """
+        XXH3 64-bit implementation using xxhash library
+        
+        Args:
+            key: The key to hash (string or bytes)
+            seed: Hash seed for consistent hashing
+            
+        Returns:
+            64-bit hash value (unsigned)
+        """
+        # Unlike mmh3, xxhash only accepts bytes
+        if isinstance(key, str):
+            key = key.encode('utf-8')
+        
+        if HAS_XXHASH:
+            return xxhash.xxh3_64_intdigest(key, seed)
+        else:
+            # Fallback implementation
+            seed_bytes = (seed & 0xffffffffffffffff).to_bytes(8, 'little')
+            digest = hashlib.blake2b(key, digest_size=8, key=seed_bytes).digest()
+            return int.from_bytes(digest, 'little')
 
 
 class ShardManager:
@@ -81,6 +142,38 @@ class ShardManager:
         """
         self.config = config
         self._hash_func = self._get_hash_function()
+        # Flattened copies of config values read on every lookup
+        self._seed = config.hash_seed
+        self._total = config.total_shards
+        self._hash_bits = 64 if config.algorithm in ("murmur3_128", "xxh3_64") else 32
+        if HAS_NUMPY:
+            self._hash_dtype = np.uint64 if self._hash_bits == 64 else np.uint32
+            self._shard_dtype = np.uint16 if self._total <= 1 << 16 else np.uint32
+        
+        self._bind_lookups()
+    
+    def _bind_lookups(self):
+        """Attach the per-instance lookup functions"""
+        # Power-of-two shard counts reduce multiply-shift to a plain shift.
+        # Only specialize the base lookup; subclasses route differently.
+        if (type(self).get_shard_id is ShardManager.get_shard_id
+                and self._total > 0 and self._total & (self._total - 1) == 0):
+            self.get_shard_id = self._make_power_of_two_lookup()
+        
+        # Key -> shard is stable, so repeat lookups can skip hashing entirely
+        self.cached_get_shard_id = functools.lru_cache(maxsize=self.config.cache_size)(self.get_shard_id)
+    
+    def __getstate__(self) -> dict:
+        """Drop the per-instance lookup closures, which can't be pickled"""
+        state = self.__dict__.copy()
+        state.pop('get_shard_id', None)
+        state.pop('cached_get_shard_id', None)
+        return state
+    
+    def __setstate__(self, state: dict):
+        """Restore state and rebuild the lookup closures for the new object"""
+        self.__dict__.update(state)
+        self._bind_lookups()
         
     def _get_hash_function(self):
         """Get the appropriate hash function based on configuration"""
@@ -88,30 +181,81 @@ class ShardManager:
             return MurmurHash.murmur3_32
         elif self.config.algorithm == "murmur3_128":
             return MurmurHash.murmur3_128
+        elif self.config.algorithm == "xxh3_64":
+            return XXHash.xxh3_64
         else:
             raise ValueError(f"Unsupported hash algorithm: {self.config.algorithm}")
     
+    def _make_power_of_two_lookup(self):
+        """
+        Build a get_shard_id specialized for a power-of-two shard count
+        
+        (hash * 2**k) >> hash_bits is hash >> (hash_bits - k), so the result
+        matches get_shard_id exactly while skipping the multiply and every
+        attribute lookup.
+        """
+        hash_func = self._hash_func
+        seed = self._seed
+        shift = self._hash_bits - (self._total.bit_length() - 1)
+        
+        def get_shard_id(key: Union[str, int, bytes]) -> int:
+            if isinstance(key, int):
+                key = key.to_bytes(8, 'little', signed=True)
+            return hash_func(key, seed) >> shift
+        
+        get_shard_id.__doc__ = ShardManager.get_shard_id.__doc__
+        return get_shard_id
+    
+    def hash_keys(self, keys: List[Union[str, int, bytes]]):
+        """
+        Hash a batch of keys with the configured algorithm and seed
+        
+        The result can be passed to get_shard_ids_for_hashes to route the
+        same keys repeatedly without rehashing them.
+        
+        Args:
+            keys: List (or numpy array) of sharding keys
+            
+        Returns:
+            Array of unsigned hashes in key order (a list when numpy is unavailable)
+        """
+        if HAS_NUMPY and isinstance(keys, np.ndarray):
+            # Unbox numpy scalars so integer ids take the same path as Python ints
+            keys = keys.tolist()
+        
+        hash_func = self._hash_func
+        seed = self._seed
+        hashes = (hash_func(key.to_bytes(8, 'little', signed=True) if isinstance(key, int) else key, seed)
+                  for key in keys)
+        
+        if not HAS_NUMPY:
+            return list(hashes)
+        return np.fromiter(hashes, dtype=self._hash_dtype, count=len(keys))
+    
     def get_shard_id(self, key: Union[str, int, bytes]) -> int:
         """
         Determine which shard a key belongs to
         
+        Integer keys are hashed as signed 64-bit little-endian bytes, so
+        123 and "123" map independently.
+        
         Args:
-            key: The sharding key
+            key: The sharding key (integers must fit in a signed 64-bit value)
             
         Returns:
             Shard ID (0-based)
         """
-        # Convert key to string if it's an integer
+        # Hash integer keys as their fixed 8-byte little-endian form
         if isinstance(key, int):
-            key = str(key)
+            key = key.to_bytes(8, 'little', signed=True)
         
-        # Calculate hash
-        hash_value = self._hash_func(key, self.config.hash_seed)
-        
-        # Determine shard using modulo
-        shard_id = hash_value % self.config.total_shards
-        
-        return shard_id
+        # Map the hash onto [0, total_shards) with multiply-shift
+        # (Lemire's fastrange), avoiding an integer division per lookup
+        return (self._hash_func(key, self._seed) * self._total) >> self._hash_bits
+    
+    def _shard_for_hash(self, hash_value: int) -> int:
+        """Map an already computed key hash to its shard"""
+        return (hash_value * self._total) >> self._hash_bits
     
     def get_shard_key_distribution(self, keys: List[Union[str, int, bytes]]) -> dict:
         """
@@ -123,35 +267,69 @@ class ShardManager:
         Returns:
             Dictionary with shard_id -> count mapping
         """
-        distribution = {}
+        if not HAS_NUMPY:
+            return dict(Counter(map(self.get_shard_id, keys)))
+        
+        counts = np.bincount(self.get_shard_ids(keys), minlength=self._total)
+        return {shard_id: int(count) for shard_id, count in enumerate(counts) if count}
+    
+    def get_shard_ids(self, keys):
+        """
+        Determine shards for a batch of keys in one vectorized operation
         
-        for key in keys:
-            shard_id = self.get_shard_id(key)
-            distribution[shard_id] = distribution.get(shard_id, 0) + 1
+        Args:
+            keys: List (or numpy array) of sharding keys
+            
+        Returns:
+            Array of shard IDs in key order (a list when numpy is unavailable)
+        """
+        if not HAS_NUMPY:
+            return [self.get_shard_id(key) for key in keys]
         
-        return distribution
+        return self.get_shard_ids_for_hashes(self.hash_keys(keys))
     
-    def get_database_config(self, base_db_name: str = "myapp") -> dict:
+    def get_shard_ids_for_hashes(self, hashes):
         """
-        Generate database configuration for each shard
+        Determine shards for key hashes already produced by hash_keys
         
         Args:
-            base_db_name: Base name for databases
+            hashes: Output of hash_keys for this manager
             
         Returns:
-            Dictionary mapping shard_id to database configuration
+            Array of shard IDs in hash order (a list when numpy is unavailable)
         """
-        db_configs = {}
+        if not HAS_NUMPY:
+            return [self._shard_for_hash(hash_value) for hash_value in hashes]
         
-        for shard_id in range(self.config.total_shards):
-            db_configs[shard_id] = {
-                'database_name': f"{base_db_name}_shard_{shard_id}",
-                'shard_id': shard_id,
-                'host': f"db-shard-{shard_id}.example.com",  # Customize as needed
-                'port': 5432 + shard_id,  # Customize as needed
-            }
+        # Vectorized (hash * total_shards) >> hash_bits. Hashes are left-aligned
+        # to 64 bits and the 128-bit product is built from 32-bit halves so
+        # every step fits in uint64.
+        hashes = hashes.astype(np.uint64) << np.uint64(64 - self._hash_bits)
+        total = np.uint64(self._total)
+        shift = np.uint64(32)
+        high = (hashes >> shift) * total
+        low = ((hashes & np.uint64(0xffffffff)) * total) >> shift
+        return ((high + low) >> shift).astype(self._shard_dtype)
+    
+    def get_database_config(self, base_db_name: str = "myapp") -> tuple:
+        """
+        Generate database configuration for each shard
         
-        return db_configs
+        Args:
+            base_db_name: Base name for databases
+            
+        Returns:
+            Tuple of ShardEndpoint, indexable by shard_id
+        """
+        return tuple(
+            ShardEndpoint(
+                shard_id=shard_id,
+                database_name=f"{base_db_name}_shard_{shard_id}",
+                host=f"db-shard-{shard_id}.example.com",  # Customize as needed
+                port=5432 + shard_id,  # Customize as needed
+            )
+            for shard_id in range(self.config.total_shards)
+        )
     
     def migrate_key(self, key: Union[str, int, bytes], 
                    old_total_shards: int) -> tuple:
@@ -165,12 +343,13 @@ class ShardManager:
         Returns:
             Tuple of (old_shard_id, new_shard_id, needs_migration)
         """
-        # Calculate old shard
-        hash_value = self._hash_func(key, self.config.hash_seed)
-        old_shard_id = hash_value % old_total_shards
+        if isinstance(key, int):
+            key = key.to_bytes(8, 'little', signed=True)
         
-        # Calculate new shard
-        new_shard_id = self.get_shard_id(key)
+        # Hash once and derive both the old and the new shard from it
+        hash_value = self._hash_func(key, self._seed)
+        old_shard_id = (hash_value * old_total_shards) >> self._hash_bits
+        new_shard_id = self._shard_for_hash(hash_value)
         
         needs_migration = old_shard_id != new_shard_id
         
@@ -182,32 +361,175 @@ class ConsistentHashShardManager(ShardManager):
     Extended shard manager using consistent hashing for better redistribution
     """
     
-    def __init__(self, config: ShardConfig, virtual_nodes: int = 150):
+    def __init__(self, config: ShardConfig, virtual_nodes: int = 150,
+                 persist_ring: bool = True):
         """
         Initialize consistent hash shard manager
         
+        The hash ring is built (or loaded) on the first lookup, so managers
+        only used for configuration never pay for it.
+        
         Args:
             config: Sharding configuration
             virtual_nodes: Number of virtual nodes per shard for better distribution
+            persist_ring: Cache the built ring in the per-user cache directory and reuse it
+                on later starts (requires numpy)
         """
         super().__init__(config)
         self.virtual_nodes = virtual_nodes
-        self._ring = self._build_hash_ring()
+        self.persist_ring = persist_ring
+        self._ring_hashes = None
+        self._ring_shards = None
+        self._bucket_starts = None
+        self._bucket_shift = 0
+    
+    def _ensure_hash_ring(self):
+        """Build or load the hash ring if this is the first lookup"""
+        if self._ring_shards is None:
+            ring_hashes, ring_shards = self._load_hash_ring()
+            self._ring_hashes = ring_hashes
+            self._bucket_starts, self._bucket_shift = self._build_bucket_index(ring_hashes)
+            # _ring_shards is assigned last, so once it is set everything else
+            # is ready even if another thread is building concurrently
+            self._ring_shards = ring_shards
+    
+    def _build_bucket_index(self, ring_hashes) -> tuple:
+        """
+        Index the sorted ring by the top bits of the hash
+        
+        Bucket b covers hashes [b << shift, (b + 1) << shift) and
+        starts[b]:starts[b + 1] is the slice of ring nodes inside it, so a
+        lookup only has to bisect within one bucket. The bucket count is
+        the ring size rounded up to a power of two (capped at 2**16), which
+        leaves most buckets with zero or one node.
+        
+        Returns:
+            Tuple of (bucket_starts, shift)
+        """
+        bucket_bits = min(max(len(ring_hashes).bit_length(), 1), 16)
+        shift = self._hash_bits - bucket_bits
+        
+        if HAS_NUMPY and isinstance(ring_hashes, np.ndarray):
+            bounds = np.arange(1 << bucket_bits, dtype=self._hash_dtype) << self._hash_dtype(shift)
+            starts = np.searchsorted(ring_hashes, bounds).tolist()
+        else:
+            starts = [bisect.bisect_left(ring_hashes, b << shift) for b in range(1 << bucket_bits)]
+        starts.append(len(ring_hashes))
+        
+        return array.array('I', starts), shift
+    
+    def _ring_cache_path(self) -> str:
+        """Path of the on-disk ring cache for this configuration"""
+        # The hash backend is part of the key: the library and fallback
+        # hashes produce different rings for the same configuration
+        if self.config.algorithm == "xxh3_64":
+            backend = "xxhash" if HAS_XXHASH else "blake2b"
+        else:
+            backend = "mmh3" if HAS_MMH3 else "blake2b"
+        filename = (f"shard_ring_v{RING_CACHE_VERSION}_{self.config.total_shards}_"
+                    f"{self.virtual_nodes}_{self._seed}_{self.config.algorithm}_{backend}.npz")
+        
+        # Per-user cache dir rather than the shared temp dir, so other users
+        # can't plant ring files at a predictable path
+        cache_root = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+        return os.path.join(cache_root, 'shard_manager', filename)
     
-    def _build_hash_ring(self) -> List[tuple]:
-        """Build the consistent hash ring"""
-        ring = []
+    def _load_hash_ring(self) -> tuple:
+        """
+        Load the hash ring from the on-disk cache, building and caching it on a miss
+        
+        Returns:
+            Tuple of (ring_hashes, ring_shards)
+        """
+        if not (HAS_NUMPY and self.persist_ring):
+            return self._build_hash_ring()
+        
+        path = self._ring_cache_path()
+        try:
+            cached = np.load(path)
+            if not isinstance(cached, np.lib.npyio.NpzFile):
+                raise ValueError(f"ring cache is not an .npz archive: {path}")
+            with cached:
+                hashes, shards = cached['h'], cached['s']
+            # A stale or corrupted ring would silently misroute keys, so only
+            # accept one that is sorted and names existing shards
+            if (len(hashes) == self.config.total_shards * self.virtual_nodes
+                    and len(shards) == len(hashes)
+                    and hashes.dtype == self._hash_dtype
+                    and shards.dtype == self._shard_dtype
+                    and np.all(hashes[1:] >= hashes[:-1])
+                    and (len(shards) == 0 or shards.max() < self.config.total_shards)):
+                return hashes, shards
+        except Exception:
+            # Missing, truncated or otherwise unreadable cache file (np.load
+            # can raise OSError, EOFError, ValueError, BadZipFile, ...) -
+            # never let it break lookups, just rebuild below
+            pass
         
-        for shard_id in range(self.config.total_shards):
-            for vnode in range(self.virtual_nodes):
-                # Create virtual node identifier
-                vnode_key = f"shard_{shard_id}_vnode_{vnode}"
-                hash_value = self._hash_func(vnode_key, self.config.hash_seed)
-                ring.append((hash_value, shard_id))
+        hashes, shards = self._build_hash_ring()
         
-        # Sort by hash value
-        ring.sort(key=lambda x: x[0])
-        return ring
+        # Write to a temp file and rename so concurrent workers never read
+        # a partially written cache
+        try:
+            os.makedirs(os.path.dirname(path), mode=0o700, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(suffix='.npz', dir=os.path.dirname(path))
+        except OSError:
+            # Caching is best effort; the freshly built ring is still usable
+            return hashes, shards
+        
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                np.savez(f, h=hashes, s=shards)
+                # Make the data durable before the rename so a crash can't
+                # leave a zero-length file at the cache path
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, path)
+        except Exception:
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
+        
+        return hashes, shards
+    
+    def _build_hash_ring(self) -> tuple:
+        """
+        Build the consistent hash ring
+        
+        The ring is stored as two parallel arrays sorted by hash: the
+        virtual node hashes and the shard each virtual node belongs to.
+        Uses numpy arrays when available, array.array otherwise.
+        
+        Returns:
+            Tuple of (ring_hashes, ring_shards)
+        """
+        total_shards = self.config.total_shards
+        hash_func = self._hash_func
+        seed = self._seed
+        
+        # Virtual node identifiers, encoded once, in shard-major order
+        vnode_keys = [f"shard_{shard_id}_vnode_{vnode}".encode()
+                      for shard_id in range(total_shards)
+                      for vnode in range(self.virtual_nodes)]
+        
+        if HAS_NUMPY:
+            hashes = np.fromiter((hash_func(vnode_key, seed) for vnode_key in vnode_keys),
+                                 dtype=self._hash_dtype, count=len(vnode_keys))
+            shards = np.repeat(np.arange(total_shards, dtype=self._shard_dtype), self.virtual_nodes)
+            
+            # Sort by hash value
+            order = np.argsort(hashes, kind='stable')
+            return hashes[order], shards[order]
+        
+        # Without numpy, pack the ring into typed arrays (4 or 8 bytes per
+        # hash, 2 per shard id) instead of lists of boxed ints
+        hashes = array.array('Q' if self._hash_bits == 64 else 'I',
+                             (hash_func(vnode_key, seed) for vnode_key in vnode_keys))
+        order = sorted(range(len(hashes)), key=hashes.__getitem__)
+        return (array.array(hashes.typecode, (hashes[i] for i in order)),
+                array.array('H' if total_shards <= 1 << 16 else 'I',
+                            (i // self.virtual_nodes for i in order)))
     
     def get_shard_id(self, key: Union[str, int, bytes]) -> int:
         """
@@ -220,17 +542,39 @@ class ConsistentHashShardManager(ShardManager):
             Shard ID
         """
         if isinstance(key, int):
-            key = str(key)
+            key = key.to_bytes(8, 'little', signed=True)
         
-        hash_value = self._hash_func(key, self.config.hash_seed)
+        return self._shard_for_hash(self._hash_func(key, self._seed))
+    
+    def _shard_for_hash(self, hash_value: int) -> int:
+        """Map an already computed key hash to its shard on the ring"""
+        if self._ring_shards is None:
+            self._ensure_hash_ring()
         
-        # Find the first node in the ring with hash >= key_hash
-        for ring_hash, shard_id in self._ring:
-            if ring_hash >= hash_value:
-                return shard_id
+        # Find the first node in the ring with hash >= key_hash, searching
+        # only the key's bucket; the modulo wraps past-the-end around to the
+        # first node without a branch
+        bucket = hash_value >> self._bucket_shift
+        starts = self._bucket_starts
+        idx = bisect.bisect_left(self._ring_hashes, hash_value, starts[bucket], starts[bucket + 1])
+        return int(self._ring_shards[idx % len(self._ring_shards)])
+    
+    def get_shard_ids_for_hashes(self, hashes):
+        """
+        Determine shards for key hashes in one vectorized ring lookup
+        
+        Args:
+            hashes: Output of hash_keys for this manager
+            
+        Returns:
+            Array of shard IDs in hash order (a list when numpy is unavailable)
+        """
+        if not HAS_NUMPY:
+            return [self._shard_for_hash(hash_value) for hash_value in hashes]
         
-        # If no node found, wrap around to the first node
-        return self._ring[0][1]
+        self._ensure_hash_ring()
+        idx = np.searchsorted(self._ring_hashes, hashes)
+        return self._ring_shards[idx % len(self._ring_shards)]
 
 
 # Utility functions for common sharding scenarios
@@ -246,14 +590,15 @@ def create_user_shard_manager(total_shards: int, hash_seed: int = 42) -> ShardMa
 
 def create_consistent_shard_manager(total_shards: int, 
                                   virtual_nodes: int = 150,
-                                  hash_seed: int = 42) -> ConsistentHashShardManager:
+                                  hash_seed: int = 42,
+                                  persist_ring: bool = True) -> ConsistentHashShardManager:
     """Create a consistent hash shard manager"""
     config = ShardConfig(
         total_shards=total_shards,
         hash_seed=hash_seed,
         algorithm="murmur3_32"
     )
-    return ConsistentHashShardManager(config, virtual_nodes)
+    return ConsistentHashShardManager(config, virtual_nodes, persist_ring)
 
 
 if __name__ == "__main__":
@@ -286,7 +631,7 @@ if __name__ == "__main__":
     # Show database configuration
     print(f"\nDatabase configuration:")
     db_configs = shard_manager.get_database_config("ecommerce")
-    for shard_id, config in db_configs.items():
+    for shard_id, config in enumerate(db_configs):
         print(f"  Shard {shard_id}: {config}")
     
     # Test consistent hashing